@@ -0,0 +1,3 @@
+# -*- coding: utf-8 -*-
+
+__version__ = '0.2.9.3'
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from distutils.version import LooseVersion
+
+from . import __version__
+from .frozen import freeze
+
+
+def get_key(query_string, **options):
+    key = json.dumps([query_string, sorted(options.items())])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class MemoryQueryCache(object):
+    """
+    A least recently used cache of translated queries in process memory.
+    Queries are stored frozen, so a hit is shared with the caller instead
+    of being copied. A lock guards the OrderedDict, which is not thread
+    safe, so one cache can serve every thread of a process.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+
+    get_key = staticmethod(get_key)
+
+    def get(self, key):
+        with self._lock:
+            query_dsl = self._queries.pop(key, None)
+            if query_dsl is not None:
+                self._queries[key] = query_dsl
+        return query_dsl
+
+    def set(self, key, query_dsl):
+        query_dsl = freeze(query_dsl)
+        with self._lock:
+            self._queries.pop(key, None)
+            self._queries[key] = query_dsl
+            if len(self._queries) > self.max_size:
+                self._queries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._queries.clear()
+
+
+class SqliteQueryCache(object):
+    """
+    A cache of translated queries stored in a local sqlite file so that
+    every worker process on a host shares it and it survives restarts.
+    Entries written by an older plasticparser version are discarded,
+    while entries of newer versions are kept, so old and new workers can
+    share the file during a rolling deploy. At most max_size entries are
+    kept, none older than max_age seconds; the cache is trimmed on
+    connect and every purge_interval writes. Every thread uses its own
+    connection, so one cache can be shared by the threads of a process.
+    """
+
+    def __init__(self, path, version=__version__, timeout=1.0, max_size=100000,
+                 max_age=7 * 24 * 60 * 60, purge_interval=1000):
+        self.path = path
+        self.version = version
+        self.timeout = timeout
+        self.max_size = max_size
+        self.max_age = max_age
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._writes = 0
+
+    def _get_connection(self):
+        # sqlite connections must not be shared across threads or a fork,
+        # so each thread of each process opens its own.
+        local = self._local
+        if getattr(local, 'connection', None) is None or local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS queries ('
+                'key TEXT PRIMARY KEY, version TEXT, created REAL, dsl BLOB)')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS queries_created ON queries (created)')
+            self._purge(connection)
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    def _purge(self, connection):
+        version = LooseVersion(self.version)
+        older_versions = [(row[0],) for row in connection.execute(
+            'SELECT DISTINCT version FROM queries') if LooseVersion(row[0]) < version]
+        connection.executemany('DELETE FROM queries WHERE version = ?', older_versions)
+        connection.execute(
+            'DELETE FROM queries WHERE created < ?', (time.time() - self.max_age,))
+        connection.execute(
+            'DELETE FROM queries WHERE rowid IN (SELECT rowid FROM queries '
+            'ORDER BY created DESC, rowid DESC LIMIT -1 OFFSET ?)', (self.max_size,))
+        connection.commit()
+
+    get_key = staticmethod(get_key)
+
+    def get(self, key):
+        try:
+            row = self._get_connection().execute(
+                'SELECT dsl FROM queries WHERE key = ? AND version = ?',
+                (key, self.version)).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, key, query_dsl):
+        dsl = zlib.compress(json.dumps(query_dsl, separators=(',', ':')))
+        try:
+            connection = self._get_connection()
+            connection.execute(
+                'INSERT OR REPLACE INTO queries (key, version, created, dsl) '
+                'VALUES (?, ?, ?, ?)',
+                (key, self.version, time.time(), sqlite3.Binary(dsl)))
+            connection.commit()
+            self._writes += 1
+            if self._writes % self.purge_interval == 0:
+                self._purge(connection)
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        try:
+            connection = self._get_connection()
+            connection.execute('DELETE FROM queries')
+            connection.commit()
+        except sqlite3.Error:
+            pass
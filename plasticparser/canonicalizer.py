@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import re
+
+from . import tokenizer
+from .grammar_parsers import RESERVED_CHARS
+
+LOGICAL_OPERATORS = (u'AND', u'OR')
+NON_COMMUTATIVE_OPERATORS = (u'NOT', u'OR')
+
+# a reserved character escaped by the grammar_parsers sanitizers
+ESCAPED_RESERVED_CHARS = re.compile(u'\\\\({})'.format(
+    u'|'.join(re.escape(char) for char in RESERVED_CHARS)))
+
+
+def unescape(value):
+    """
+    reverts the escaping of reserved characters done while parsing, so
+    the value can be parsed again
+    """
+    return ESCAPED_RESERVED_CHARS.sub(u'\\1', value)
+
+
+def split_clauses(query):
+    """
+    splits a query string on whitespace that is neither inside
+    parentheses nor inside a quoted phrase.
+    """
+    clauses = []
+    clause = []
+    depth = 0
+    quoted = False
+    escaped = False
+    for char in query:
+        if escaped:
+            escaped = False
+        elif char == u'\\':
+            escaped = True
+        elif char == u'"':
+            quoted = not quoted
+        elif not quoted and char == u'(':
+            depth += 1
+        elif not quoted and char == u')':
+            depth = max(depth - 1, 0)
+        elif not quoted and not depth and char.isspace():
+            if clause:
+                clauses.append(u''.join(clause))
+                clause = []
+            continue
+        clause.append(char)
+    if clause:
+        clauses.append(u''.join(clause))
+    return clauses
+
+
+def canonicalize_query_string(query, default_operator='and'):
+    """
+    returns the top level clauses of a parsed query string joined by
+    single spaces. When every clause is required (explicit AND, or
+    whitespace with an 'and' default operator) the clauses are
+    commutative, so they are de-duplicated, sorted and joined by AND.
+    """
+    clauses = [unescape(clause) for clause in split_clauses(query)]
+    if default_operator.lower() != 'and' or any(
+            clause in NON_COMMUTATIVE_OPERATORS for clause in clauses):
+        return u' '.join(clauses)
+    terms = sorted(set(clause for clause in clauses
+                       if clause not in LOGICAL_OPERATORS))
+    return u' AND '.join(terms)
+
+
+def canonicalize(query_string, default_operator='and', facets_query_size=20,
+                 max_facets_query_size=None, merge_nested=False,
+                 field_mapping=None):
+    """
+    returns the canonical form of a query string.
+    Queries which only differ in operator case, whitespace, order of
+    AND clauses, order of facets or nested clauses, or in how their
+    values need to be escaped share the same canonical form. Facets
+    always carry their size, as the default size depends on
+    facets_query_size.
+    The canonical form is built from the parsed query with the escaping
+    of values reverted, so it is itself a query string which parses to
+    an equivalent query and canonicalizes to itself. The options are
+    those of plasticparser.get_query_dsl and the query is parsed with
+    exactly these, so the result only depends on the arguments.
+    """
+    expression = tokenizer.tokenize(
+        query_string, default_operator=default_operator,
+        facets_query_size=facets_query_size,
+        max_facets_query_size=max_facets_query_size,
+        merge_nested=merge_nested, field_mapping=field_mapping)
+    filtered = expression['query']['filtered']
+    parts = []
+    nested_parts = []
+    for must in filtered['filter']['bool']['must']:
+        if 'type' in must:
+            parts.append(u'type:{}'.format(must['type']['value']))
+        elif 'nested' in must:
+            nested_query = must['nested']['query']['query_string']['query']
+            nested_parts.append(u'{}({})'.format(
+                must['nested']['path'],
+                canonicalize_query_string(nested_query)))
+    if 'query' in filtered:
+        query = filtered['query']['query_string']['query']
+        parts.append(canonicalize_query_string(query, default_operator))
+    if nested_parts:
+        parts.append(u'nested:[{}]'.format(u' '.join(sorted(set(nested_parts)))))
+    facets = expression.get('facets', {})
+    if facets:
+        facet_parts = []
+        for facet_key in sorted(facets):
+            terms = facets[facet_key]['terms']
+            facet_part = u'{}:{}'.format(facet_key, terms['size'])
+            if 'order' in terms:
+                facet_part += u'(order:{})'.format(terms['order'])
+            facet_filter = facets[facet_key].get('facet_filter')
+            if facet_filter:
+                facet_query = facet_filter['query']['query_string']['query']
+                facet_part += u'({})'.format(canonicalize_query_string(facet_query))
+            facet_parts.append(facet_part)
+        parts.append(u'facets:[{}]'.format(u' '.join(facet_parts)))
+    if '_source' in expression:
+        parts.append(u'fields:[{}]'.format(
+            u' '.join(sorted(set(expression['_source']['includes'])))))
+    for directive in ('from', 'size'):
+        if directive in expression:
+            parts.append(u'{}:{}'.format(directive, expression[directive]))
+    return u' '.join(part for part in parts if part)
+
+
+def get_query_hash(query_string, default_operator='and', facets_query_size=20,
+                   max_facets_query_size=None, merge_nested=False,
+                   field_mapping=None):
+    """
+    returns a stable hex digest of the canonical form of a query string
+    which can be used as a cache key for its results.
+    It takes the options of canonicalize. A default operator other than
+    and is part of the digest, since the canonical form of a query
+    whose clauses are not sorted does not show it.
+    """
+    canonical_query = canonicalize(
+        query_string, default_operator, facets_query_size,
+        max_facets_query_size, merge_nested, field_mapping)
+    if default_operator.lower() != 'and':
+        canonical_query = u'{}\n{}'.format(default_operator.lower(), canonical_query)
+    return hashlib.sha1(canonical_query.encode('utf-8')).hexdigest()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+
+
+class DisallowedFieldError(ValueError):
+    pass
+
+
+class FieldMapping(object):
+    """
+    Maps the field names users write in queries to index fields.
+
+    param: aliases : a dictionary of the form {user_field: index_field}
+    param: suffixes : a dictionary of the form {index_field: suffix},
+     e.g. {'title': '_nonngram'}, appended to the index field.
+    param: disallowed_fields : user fields which may not be queried.
+     Using one raises DisallowedFieldError.
+
+    The lookup table is compiled once, so mapping a field while parsing
+    is a single dictionary lookup.
+    """
+
+    def __init__(self, aliases=None, suffixes=None, disallowed_fields=None):
+        self.aliases = aliases or {}
+        self.suffixes = suffixes or {}
+        self.disallowed_fields = frozenset(disallowed_fields or ())
+        self.fields = dict((field, field + suffix)
+                           for field, suffix in self.suffixes.items())
+        self.fields.update((field, alias + self.suffixes.get(alias, u''))
+                           for field, alias in self.aliases.items())
+
+    def check_field(self, field):
+        """
+        raises DisallowedFieldError for a disallowed field, also when it
+        is prefixed by one of the +, - or ! operators
+        """
+        if field.lstrip(u'+-!') in self.disallowed_fields:
+            raise DisallowedFieldError(u'{} can not be queried'.format(field))
+
+    def get_field(self, field):
+        """
+        returns the index field, with its suffix, to query for a user field
+        """
+        self.check_field(field)
+        return self.fields.get(field, field)
+
+    def get_index_field(self, field):
+        """
+        returns the index field for a user field without its suffix,
+        as used for facets and nested paths
+        """
+        self.check_field(field)
+        return self.aliases.get(field, field)
+
+    def get_key(self):
+        key = json.dumps([sorted(self.aliases.items()),
+                          sorted(self.suffixes.items()),
+                          sorted(self.disallowed_fields)])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+
+def _immutable(self, *args, **kwargs):
+    raise TypeError(u'{} is immutable'.format(type(self).__name__))
+
+
+class FrozenDict(dict):
+    """
+    An immutable dict, so that a query dsl tree can be shared, e.g. from a
+    cache, without copying it. Being a dict it compares equal to and
+    serializes like a plain query dsl. set_in and append_in change a tree
+    by copying only the containers on the changed path.
+    """
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = \
+        _immutable
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+class FrozenList(list):
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = __iadd__ = \
+        __imul__ = append = extend = insert = pop = remove = reverse = sort = \
+        _immutable
+
+    def __reduce__(self):
+        return FrozenList, (list(self),)
+
+
+def freeze(value):
+    """
+    returns an immutable copy of a query dsl tree.
+    Trees which are already frozen are returned as they are.
+    """
+    if isinstance(value, (FrozenDict, FrozenList)):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return FrozenList(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """
+    returns a plain, mutable copy of a query dsl tree
+    """
+    if isinstance(value, dict):
+        return dict((key, thaw(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [thaw(item) for item in value]
+    return value
+
+
+def set_in(tree, path, value):
+    """
+    returns a frozen tree with value set at path, e.g. ('sort',),
+    copying only the dictionaries along path
+    """
+    key = path[0]
+    if len(path) > 1:
+        value = set_in(tree.get(key, FrozenDict()), path[1:], value)
+    else:
+        value = freeze(value)
+    items = dict(tree)
+    items[key] = value
+    return FrozenDict(items)
+
+
+def append_in(tree, path, values):
+    """
+    returns a frozen tree with values appended to the list at path,
+    e.g. ('query', 'filtered', 'filter', 'bool', 'must')
+    """
+    items = list(get_in(tree, path, ()))
+    items.extend(freeze(value) for value in values)
+    return set_in(tree, path, FrozenList(items))
+
+
+def get_in(tree, path, default=None):
+    for key in path:
+        if key not in tree:
+            return default
+        tree = tree[key]
+    return tree
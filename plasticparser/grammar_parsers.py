@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
-import plasticparser
+import re
+import threading
+
+# size of a result page elasticsearch uses when only from is given
+DEFAULT_PAGE_SIZE = 10
 
 RESERVED_CHARS = ('\\', '+', '-', '&&',
                   '||', '!', '(', ')',
@@ -7,6 +11,48 @@ RESERVED_CHARS = ('\\', '+', '-', '&&',
                   '^', '~', '*',
                   '?', '/', ':')
 
+
+def get_reserved_chars_pattern(reserved_chars):
+    # one pass over the value instead of a replace per reserved char
+    return re.compile(u'|'.join(re.escape(char) for char in reserved_chars))
+
+
+VALUE_RESERVED_CHARS = get_reserved_chars_pattern(
+    char for char in RESERVED_CHARS if char not in "(")
+FACET_VALUE_RESERVED_CHARS = get_reserved_chars_pattern(
+    char for char in RESERVED_CHARS if char not in ['"', '(', ')'])
+FREE_TEXT_RESERVED_CHARS = get_reserved_chars_pattern(
+    char for char in RESERVED_CHARS if char not in ['(', ')', ':'])
+
+
+def escape_reserved_char(match):
+    return u'\\' + match.group()
+
+
+# options of a single parse. tokenizer.tokenize sets them on
+# parse_context for the duration of the parse, so they neither carry
+# over to later parses nor leak between threads.
+PARSE_OPTIONS = {
+    'facets_query_size': 20,
+    'max_facets_query_size': None,
+    'max_result_window': 10000,
+    'default_operator': 'and',
+    'merge_nested': False,
+    'field_mapping': None,
+}
+
+parse_context = threading.local()
+
+
+def get_parse_option(name):
+    options = getattr(parse_context, 'options', None) or PARSE_OPTIONS
+    return options[name]
+
+
+class DeepPagingError(ValueError):
+    pass
+
+
 class Facets(object):
     def __init__(self, facets_dsl):
         self.facets_dsl = facets_dsl
@@ -15,6 +61,14 @@ class Facets(object):
         return self.facets_dsl
 
 
+class FacetTerms(object):
+    def __init__(self, terms_dsl):
+        self.terms_dsl = terms_dsl
+
+    def get_query(self):
+        return self.terms_dsl
+
+
 class Nested(object):
     def __init__(self, nested_dsl):
         self.nested_dsl = nested_dsl
@@ -31,6 +85,14 @@ class Type(object):
         return self.type_dsl
 
 
+class Directives(object):
+    def __init__(self, directives_dsl):
+        self.directives_dsl = directives_dsl
+
+    def get_query(self):
+        return self.directives_dsl
+
+
 class Query(object):
     def __init__(self, query):
         self.query = query
@@ -42,28 +104,28 @@ class Query(object):
 def sanitize_value(value):
     if not isinstance(value, basestring):
         return value
-    for char in RESERVED_CHARS:
-        if char not in "(":
-            value = value.replace(char, u'\{}'.format(char))
-    return value
+    return VALUE_RESERVED_CHARS.sub(escape_reserved_char, unicode(value))
 
 
 def sanitize_facet_value(value):
     if not isinstance(value, basestring):
         return value
-    for char in RESERVED_CHARS:
-        if char not in ['"', '(', ')']:
-            value = value.replace(char, u'\{}'.format(char))
-    return value
+    return FACET_VALUE_RESERVED_CHARS.sub(escape_reserved_char, unicode(value))
 
 
 def sanitize_free_text(value):
     if not isinstance(value, basestring):
         return value
-    for char in RESERVED_CHARS:
-        if char not in ['(', ')', ':']:
-            value = value.replace(char, u'\{}'.format(char))
-    return value
+    return FREE_TEXT_RESERVED_CHARS.sub(escape_reserved_char, unicode(value))
+
+
+def map_field(field, with_suffix=True):
+    field_mapping = get_parse_option('field_mapping')
+    if field_mapping is None:
+        return field
+    if with_suffix:
+        return field_mapping.get_field(field)
+    return field_mapping.get_index_field(field)
 
 
 def parse_free_text(tokens):
@@ -71,15 +133,29 @@ def parse_free_text(tokens):
 
 
 def parse_compare_expression(tokens):
-    return u"{}{}{}".format(tokens[0], tokens[1], sanitize_value(tokens[2]))
+    return u"{}{}{}".format(
+        map_field(tokens[0]), tokens[1], sanitize_value(tokens[2]))
+
+
+def check_field(field):
+    field_mapping = get_parse_option('field_mapping')
+    if field_mapping is not None:
+        field_mapping.check_field(field)
 
 
 def parse_facet_compare_expression(tokens):
+    # fields in facet filters and nested queries are relative to the
+    # facet or path, so they are not mapped, but still rejected when
+    # disallowed. A compare without parens, e.g. salary:1, is one token.
+    if len(tokens) > 1:
+        check_field(tokens[0])
+    elif u':' in tokens[0] and not tokens[0].startswith(u'"'):
+        check_field(tokens[0].split(u':', 1)[0])
     return u"{}{}{}".format(tokens[0], tokens[1], sanitize_facet_value(tokens[2]))
 
 
 def parse_logical_expression(tokens):
-    return u' '.join(tokens.asList())
+    return u' '.join(tokens)
 
 
 def parse_paren_base_logical_expression(tokens):
@@ -87,18 +163,13 @@ def parse_paren_base_logical_expression(tokens):
 
 
 def default_parse_func(tokens):
-    token_list = tokens.asList()
+    token_list = []
     return_list = []
-    for token in token_list:
-        if isinstance(token, Nested):
-            return_list.append(token)
-            token_list.remove(token)
-        if isinstance(token, Facets):
-            return_list.append(token)
-            token_list.remove(token)
-        if isinstance(token, type):
+    for token in tokens.asList():
+        if isinstance(token, (Nested, Facets, Type, Directives)):
             return_list.append(token)
-            token_list.remove(token)
+        else:
+            token_list.append(token)
     query = Query(' '.join(token_list))
     return_list.append(query)
     return return_list
@@ -115,13 +186,13 @@ def parse_type_expression(tokens):
 
 def parse_type_logical_facets_expression(tokens):
     must_list = []
-    should_list = []
-    must_not_list = []
+    nested_list = []
     facets = {}
+    directives = {}
     for token in tokens.asList():
         if isinstance(token, Nested):
             nested = token.get_query()
-            must_list.append(nested)
+            nested_list.append(nested)
         if isinstance(token, Query):
             query = token.get_query()
         if isinstance(token, Facets):
@@ -129,14 +200,33 @@ def parse_type_logical_facets_expression(tokens):
         if isinstance(token, Type):
             type = token.get_query()
             must_list.append(type)
+        if isinstance(token, Directives):
+            directives.update(token.get_query())
+    must_list.extend(merge_nested_queries(nested_list))
+    if "from" in directives or "size" in directives:
+        check_result_window(directives.get("from", 0),
+                            directives.get("size", DEFAULT_PAGE_SIZE))
+    query_dsl = build_query_dsl(must_list, query, facets)
+    query_dsl.update(directives)
+    return query_dsl
+
+
+def check_result_window(from_, size):
+    max_result_window = get_parse_option('max_result_window')
+    if max_result_window is not None and from_ + size > max_result_window:
+        raise DeepPagingError(
+            u'from + size can not exceed {}'.format(max_result_window))
+
+
+def build_query_dsl(must_list, query, facets=None):
     query_dsl = {
         "query": {
             "filtered": {
                 "filter": {
                     "bool": {
                         "must": must_list,
-                        "should": should_list,
-                        "must_not": must_not_list
+                        "should": [],
+                        "must_not": []
                     }
                 }
             }
@@ -148,35 +238,63 @@ def parse_type_logical_facets_expression(tokens):
         query_dsl["query"]["filtered"]["query"] = {
             "query_string": {
                 "query": query,
-                "default_operator": getattr(
-                    plasticparser, 'DEFAULT_OPERATOR', 'and')
+                "default_operator": get_parse_option('default_operator')
             }
         }
     return query_dsl
 
 
+def parse_facet_terms_expression(tokens):
+    terms = {"size": int(tokens[0])}
+    if len(tokens) > 1:
+        terms["order"] = tokens[1]
+    return FacetTerms(terms)
+
+
+def parse_fields_expression(tokens):
+    return Directives({
+        "_source": {
+            "includes": [map_field(field, with_suffix=False)
+                         for field in tokens.asList()]
+        }
+    })
+
+
+def parse_page_expression(tokens):
+    return Directives({tokens[0]: int(tokens[1])})
+
+
 def parse_single_facet_expression(tokens):
     facet_key = tokens[0]
     filters = {
         facet_key: {}
     }
-    field = facet_key
-    if "." in facet_key:
-        nested_keys = facet_key.split(".")
+    index_field = field = map_field(facet_key, with_suffix=False)
+    if "." in index_field:
+        nested_keys = index_field.split(".")
         nested_field = u".".join(nested_keys[:-1])
         field = nested_keys[-1]
 
     field = "{}_nonngram".format(field)
-    filters[facet_key]["terms"] = {"field": field, "size": getattr(
-        plasticparser, 'FACETS_QUERY_SIZE', 20)}
-    if len(tokens) > 1:
+    filters[facet_key]["terms"] = terms = {
+        "field": field, "size": get_parse_option('facets_query_size')}
+    facet_query = None
+    for token in tokens[1:]:
+        if isinstance(token, FacetTerms):
+            terms.update(token.get_query())
+        else:
+            facet_query = token
+    max_size = get_parse_option('max_facets_query_size')
+    if max_size is not None:
+        terms["size"] = min(terms["size"], max_size)
+    if facet_query is not None:
         filters[facet_key]["facet_filter"] = {
             "query": {
-                "query_string": {"query": tokens[1], "default_operator": "and"}
+                "query_string": {"query": facet_query, "default_operator": "and"}
             }
         }
 
-    if len(tokens) > 1 and "." in facet_key:
+    if facet_query is not None and "." in index_field:
         filters[facet_key]['nested'] = nested_field
     return filters
 
@@ -189,11 +307,11 @@ def parse_base_facets_expression(tokens):
 
 
 def join_words(tokens):
-    return u' '.join(tokens.asList())
+    return u' '.join(tokens)
 
 
 def join_brackets(tokens):
-    return u''.join(tokens.asList())
+    return u''.join(tokens)
 
 
 def parse_one_or_more_facets_expression(tokens):
@@ -201,13 +319,13 @@ def parse_one_or_more_facets_expression(tokens):
 
 
 def parse_base_nested_expression(tokens):
-    return tokens[0]
+    return tokens.asList()
 
 
 def parse_single_nested_expression(tokens):
     return Nested({
         "nested": {
-            "path": tokens[0],
+            "path": map_field(tokens[0], with_suffix=False),
             "query": {
                 "query_string": {
                     "query": tokens[1],
@@ -216,3 +334,38 @@ def parse_single_nested_expression(tokens):
             }
         }
     })
+
+
+def merge_nested_queries(nested_list):
+    """
+    combines nested queries sharing a path so that elasticsearch runs
+    one nested join per path instead of one per clause.
+    Exact duplicates are always dropped. Distinct queries on the same
+    path are only combined with the merge_nested option, since a single
+    nested query requires one nested document to match all of them.
+    """
+    merge = get_parse_option('merge_nested')
+    merged_list = []
+    queries_by_path = {}
+    for nested in nested_list:
+        if nested in merged_list:
+            continue
+        path = nested['nested']['path']
+        if not merge or path not in queries_by_path:
+            merged_list.append(nested)
+            queries_by_path.setdefault(path, [nested])
+            continue
+        queries = queries_by_path[path]
+        query_string = nested['nested']['query']['query_string']['query']
+        if query_string not in [query['nested']['query']['query_string']['query']
+                                for query in queries]:
+            queries.append(nested)
+
+    for path, queries in queries_by_path.items():
+        if len(queries) < 2:
+            continue
+        query_strings = [query['nested']['query']['query_string']['query']
+                         for query in queries]
+        queries[0]['nested']['query']['query_string']['query'] = u' AND '.join(
+            u'({})'.format(query_string) for query_string in query_strings)
+    return merged_list
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import re
+from collections import namedtuple
+
+KEY = 'key'
+OPERATOR = 'operator'
+VALUE = 'value'
+TEXT = 'text'
+LOGICAL_OPERATOR = 'logical_operator'
+PAREN = 'paren'
+SEPARATOR = 'separator'
+DIRECTIVE = 'directive'
+ERROR = 'error'
+
+Token = namedtuple('Token', 'type value start end')
+
+TOKEN_PATTERN = re.compile(u'''
+    (?P<space>\\s+)
+  | (?P<quoted>"(?:[^"\\\\]|\\\\.)*")
+  | (?P<unclosed_quote>")
+  | (?P<open>[(\\[])
+  | (?P<close>[)\\]])
+  | (?P<separator>,)
+  | (?P<directive>(?:facets|nested|fields):
+                 |(?:size|from):(?=\\s*[0-9]+(?![^\\s)\\]])))
+  | (?P<operator>:(?:<=|>=|<|>|=)?)
+  | (?P<word>[^\\s"()\\[\\],:]+)
+''', re.UNICODE | re.VERBOSE)
+
+VALUE_PATTERN = re.compile(u'(?:"(?:[^"\\\\]|\\\\.)*"|[^\\s"()\\[\\],]+)', re.UNICODE)
+SPACE_PATTERN = re.compile(u'\\s*', re.UNICODE)
+
+TYPE_DIRECTIVE = u'type:'
+LOGICAL_OPERATORS = ('and', 'or')
+LIST_DIRECTIVES = ('facets:', 'nested:', 'fields:')
+CLOSING_PARENS = {u'(': u')', u'[': u']'}
+
+
+def iter_tokens(query_string):
+    """
+    yields the tokens of a query string as Token(type, value, start, end)
+    tuples, where start and end are offsets into query_string.
+    It only scans the query, without running the grammar, so it is cheap
+    enough to call on every keystroke, e.g. to highlight a query.
+    Malformed input ends the tokens with an ERROR token at the offending
+    position: an unmatched paren or bracket, or an unclosed quote.
+    """
+    # each open paren is kept as (paren, start, kind) where kind is
+    # 'list' for facets:[...], nested:[...] and fields:[...], 'value' for
+    # a field's value such as name:(john OR jane) and 'group' otherwise.
+    open_parens = []
+    previous_type = None
+    expects_value = False
+    expects_list = False
+    position = 0
+    length = len(query_string)
+    while position < length:
+        if expects_value:
+            position = SPACE_PATTERN.match(query_string, position).end()
+            match = VALUE_PATTERN.match(query_string, position)
+            expects_value = False
+            if match:
+                previous_type = VALUE
+                yield Token(VALUE, match.group(), position, match.end())
+                position = match.end()
+                continue
+            if position >= length:
+                break
+        if previous_type is None and query_string.startswith(TYPE_DIRECTIVE, position):
+            # type: is only a directive at the start of a query, elsewhere
+            # it is a field as in python type:def
+            expects_value = True
+            previous_type = DIRECTIVE
+            yield Token(DIRECTIVE, TYPE_DIRECTIVE, position, position + len(TYPE_DIRECTIVE))
+            position += len(TYPE_DIRECTIVE)
+            continue
+        match = TOKEN_PATTERN.match(query_string, position)
+        kind = match.lastgroup
+        value = match.group()
+        start, position = match.start(), match.end()
+        if kind == 'space':
+            continue
+        if kind == 'unclosed_quote':
+            yield Token(ERROR, query_string[start:], start, length)
+            return
+        if kind == 'open':
+            if value == u'[':
+                paren_kind = 'list' if expects_list else 'group'
+            else:
+                paren_kind = 'value' if previous_type == OPERATOR else 'group'
+            open_parens.append((value, start, paren_kind))
+            expects_list = False
+            previous_type = PAREN
+            yield Token(PAREN, value, start, position)
+            continue
+        if kind == 'close':
+            if not open_parens or CLOSING_PARENS[open_parens[-1][0]] != value:
+                yield Token(ERROR, value, start, position)
+                return
+            open_parens.pop()
+            previous_type = PAREN
+            yield Token(PAREN, value, start, position)
+            continue
+        if kind == 'directive':
+            expects_list = value in LIST_DIRECTIVES
+            expects_value = not expects_list
+            token_type = DIRECTIVE
+        elif kind == 'separator':
+            token_type = SEPARATOR
+        elif kind == 'operator':
+            expects_value = previous_type == KEY
+            token_type = OPERATOR
+        elif query_string.startswith(u':', position):
+            token_type = KEY
+        elif value.lower() in LOGICAL_OPERATORS:
+            token_type = LOGICAL_OPERATOR
+        elif open_parens and open_parens[-1][2] == 'list':
+            token_type = KEY
+        elif open_parens and open_parens[-1][2] == 'value':
+            token_type = VALUE
+        else:
+            token_type = TEXT
+        previous_type = token_type
+        yield Token(token_type, value, start, position)
+    if open_parens:
+        paren, start, _ = open_parens[-1]
+        yield Token(ERROR, paren, start, start + 1)
+
+
+def get_error_position(query_string):
+    """
+    returns the offset of the first error in a query string, or None
+    when it has none
+    """
+    for token in iter_tokens(query_string):
+        if token.type == ERROR:
+            return token.start
+    return None
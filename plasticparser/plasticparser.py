@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 from . import tokenizer
+from .frozen import FrozenDict, freeze, thaw, append_in, set_in
 
 def get_query_dsl(
-        query_string, global_filters=None, facets_query_size=20, default_operator='and'):
+        query_string, global_filters=None, facets_query_size=20, default_operator='and',
+        merge_nested=False, field_mapping=None, cache=None, frozen=False,
+        max_facets_query_size=None, max_result_window=10000):
     """
     returns an elasticsearch query dsl for a query string
     param: query_string : an expression of the form
@@ -14,13 +17,58 @@ def get_query_dsl(
      {user_id: 1234}. This gets added as a filter to the query
      so that the query can be narrowed down to fewer documents.
      It is translated into an elastic search term filter.
+
+    param: facets_query_size : the number of terms returned for a facet,
+     unless the query sets its own size as in facets:[skills:50(order:count)]
+
+    param: max_facets_query_size : an optional upper bound for the size
+     of every facet.
+
+    param: max_result_window : the largest from + size that the size: and
+     from: directives may ask for, to stop deep paging. A larger window
+     raises grammar_parsers.DeepPagingError. None disables the check.
+
+    param: merge_nested : when True, nested:[...] clauses sharing a path
+     are combined into a single nested query whose query_string ANDs
+     the individual queries, so that one nested document has to match
+     all of them.
+
+    param: field_mapping : an optional field_mapping.FieldMapping which
+     renames and suffixes fields, and rejects disallowed ones, while the
+     query is parsed.
+
+    param: cache : an optional store of translated queries such as
+     cache.SqliteQueryCache. It is keyed by the query string and the
+     options above, so the query is only parsed on a cache miss.
+
+    param: frozen : when True an immutable frozen.FrozenDict is returned.
+     It shares everything but the paths changed by global_filters with
+     the parsed, possibly cached, query, so no deep copy is made.
+     frozen.thaw converts it to plain dicts.
     """
-    global FACETS_QUERY_SIZE, DEFAULT_OPERATOR
-    FACETS_QUERY_SIZE = facets_query_size
-    DEFAULT_OPERATOR = default_operator
+    options = dict(facets_query_size=facets_query_size,
+                   max_facets_query_size=max_facets_query_size,
+                   max_result_window=max_result_window,
+                   default_operator=default_operator,
+                   merge_nested=merge_nested,
+                   field_mapping=field_mapping)
 
     global_filters = global_filters if global_filters else {}
-    expression = tokenizer.tokenize(query_string)
+    if cache is not None:
+        key = cache.get_key(query_string, **dict(
+            options, field_mapping=field_mapping and field_mapping.get_key()))
+        expression = cache.get(key)
+        if expression is None:
+            expression = tokenizer.tokenize(query_string, **options)
+            if frozen:
+                expression = freeze(expression)
+            cache.set(key, expression)
+    else:
+        expression = tokenizer.tokenize(query_string, **options)
+    if frozen:
+        return add_frozen_global_filters(freeze(expression), global_filters)
+    if isinstance(expression, FrozenDict):
+        expression = thaw(expression)
     bool_lists = expression['query']['filtered']['filter']['bool']
     [bool_lists['should'].append({"term": orele}) for orele in global_filters.get('or', [])]
     [bool_lists['must'].append({"term": andele}) for andele in global_filters.get('and', [])]
@@ -29,6 +77,16 @@ def get_query_dsl(
         expression['sort'] = global_filters.get('sort')
     return expression
 
+def add_frozen_global_filters(expression, global_filters):
+    bool_path = ('query', 'filtered', 'filter', 'bool')
+    for key, filter_key in (('should', 'or'), ('must', 'and'), ('must_not', 'not')):
+        terms = [{"term": term} for term in global_filters.get(filter_key, [])]
+        if terms:
+            expression = append_in(expression, bool_path + (key,), terms)
+    if global_filters.has_key('sort'):
+        expression = set_in(expression, ('sort',), global_filters.get('sort'))
+    return expression
+
 def get_document_types(query_string):
     """
     returns all the document types in a given query string
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Replays a recorded query log through get_query_dsl and reports how the
+throughput scales with the number of threads or processes.
+
+    python -m plasticparser.replay queries.log --mode threads --workers 1,2,4,8
+
+The log holds one query string per line.
+"""
+import argparse
+import codecs
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+from . import plasticparser, tokenizer
+
+MODES = ('threads', 'processes')
+
+
+def load_queries(path):
+    with codecs.open(path, encoding='utf-8') as query_log:
+        return [line.strip() for line in query_log if line.strip()]
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def get_cpu_time():
+    user_time, system_time = os.times()[:2]
+    return user_time + system_time
+
+
+def run_queries(queries):
+    latencies = []
+    errors = 0
+    cpu_time = get_cpu_time()
+    for query_string in queries:
+        start = time.time()
+        try:
+            plasticparser.get_query_dsl(query_string)
+        except Exception:
+            errors += 1
+        latencies.append(time.time() - start)
+    return latencies, errors, get_cpu_time() - cpu_time
+
+
+def _run_threads(chunks):
+    results = [None] * len(chunks)
+
+    def run(index, chunk):
+        results[index] = run_queries(chunk)
+
+    threads = [threading.Thread(target=run, args=(index, chunk))
+               for index, chunk in enumerate(chunks)]
+    cpu_time = get_cpu_time()
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    # cpu time is per process, so the threads' own numbers overlap
+    return results, get_cpu_time() - cpu_time, elapsed
+
+
+def _run_processes(chunks):
+    pool = multiprocessing.Pool(len(chunks), initializer=tokenizer.warmup)
+    try:
+        # give every worker time to start before the clock starts
+        pool.map(time.sleep, [0.1] * len(chunks), chunksize=1)
+        start = time.time()
+        results = pool.map(run_queries, chunks, chunksize=1)
+        elapsed = time.time() - start
+    finally:
+        pool.close()
+        pool.join()
+    return results, sum(cpu_time for _, _, cpu_time in results), elapsed
+
+
+def replay(queries, mode='threads', workers=1):
+    """
+    replays queries split over workers threads or processes and returns
+    the throughput, latencies in milliseconds, the number of cpu cores
+    used and the number of queries which failed to parse.
+    """
+    if mode not in MODES:
+        raise ValueError(u'mode should be one of {}'.format(u', '.join(MODES)))
+    chunks = [queries[index::workers] for index in range(workers)]
+    run = _run_threads if mode == 'threads' else _run_processes
+    results, cpu_time, elapsed = run(chunks)
+    latencies = [latency for chunk_latencies, _, _ in results
+                 for latency in chunk_latencies]
+    return {
+        'mode': mode,
+        'workers': workers,
+        'queries': len(latencies),
+        'errors': sum(errors for _, errors, _ in results),
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'mean': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        'p50': percentile(latencies, 50) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'max': max(latencies or [0]) * 1000,
+        'cpu': cpu_time / elapsed if elapsed else 0.0,
+    }
+
+
+def report(results, stream=sys.stdout):
+    """
+    writes replay results as a table. Scaling is the throughput compared
+    to linear scaling of the first run of the same mode. GIL wait is only
+    shown for threads which have a processes run with the same number of
+    workers: 1 - thread throughput / process throughput, the share of
+    throughput lost to the GIL, or any other lock within a process.
+    """
+    stream.write(u'{:<10} {:>7} {:>10} {:>8} {:>8} {:>8} {:>6} {:>8} {:>9} {:>7}\n'.format(
+        'mode', 'workers', 'queries/s', 'p50 ms', 'p99 ms', 'max ms', 'cpu',
+        'scaling', 'gil wait', 'errors'))
+    process_throughputs = dict((result['workers'], result['throughput'])
+                               for result in results if result['mode'] == 'processes')
+    baselines = {}
+    for result in results:
+        baseline = baselines.setdefault(result['mode'], result)
+        linear_throughput = baseline['throughput'] * result['workers'] / baseline['workers']
+        scaling = result['throughput'] / linear_throughput if linear_throughput else 0.0
+        process_throughput = process_throughputs.get(result['workers'])
+        if result['mode'] == 'threads' and process_throughput:
+            gil_wait = u'{:.0%}'.format(
+                max(1 - result['throughput'] / process_throughput, 0.0))
+        else:
+            gil_wait = u'-'
+        stream.write(u'{:<10} {:>7} {:>10.0f} {:>8.2f} {:>8.2f} {:>8.2f} {:>6.2f} {:>8.0%} {:>9} {:>7}\n'.format(
+            result['mode'], result['workers'], result['throughput'],
+            result['p50'], result['p99'], result['max'], result['cpu'],
+            scaling, gil_wait, result['errors']))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Replay a query log through plasticparser')
+    parser.add_argument('query_log', help='file with one query string per line')
+    parser.add_argument('--mode', choices=MODES + ('all',), default='all')
+    parser.add_argument('--workers', default='1,2,4,8',
+                        help='comma separated worker counts')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='number of times to replay the log')
+    args = parser.parse_args(args)
+
+    queries = load_queries(args.query_log) * args.repeat
+    # build the grammar before forking so processes share it
+    tokenizer.warmup()
+    modes = MODES if args.mode == 'all' else (args.mode,)
+    workers = [int(count) for count in args.workers.split(',')]
+    results = [replay(queries, mode, count) for mode in modes for count in workers]
+    report(results)
+    return results
+
+
+if __name__ == '__main__':
+    main()
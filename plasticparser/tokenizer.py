@@ -1,35 +1,43 @@
 # -*- coding: utf-8 -*-
+import gc
+import mmap
+import re
+from collections import Counter
 
 from peak.util.proxies import LazyProxy
 from pyparsing import (
-    Word, QuotedString, oneOf, CaselessLiteral, White,
-    OneOrMore, Optional, alphanums, srange, ZeroOrMore)
+    Word, QuotedString, oneOf, CaselessLiteral, White, Regex, Suppress, Keyword,
+    OneOrMore, Optional, alphanums, nums, srange, ZeroOrMore)
 from .grammar_parsers import (
     parse_logical_expression, parse_compare_expression, parse_free_text,
     parse_paren_base_logical_expression, join_brackets, join_words,
     parse_facet_compare_expression, parse_one_or_more_facets_expression,
     parse_single_nested_expression, parse_base_nested_expression,
     parse_single_facet_expression, parse_base_facets_expression,
+    parse_facet_terms_expression, parse_fields_expression, parse_page_expression,
     parse_type_expression, parse_one_or_more_logical_expressions,
-    parse_type_logical_facets_expression)
+    parse_type_logical_facets_expression, build_query_dsl, sanitize_free_text,
+    parse_context, PARSE_OPTIONS)
 
-unicode_printables = u''.join(unichr(c) for c in xrange(65536)
-                              if not unichr(c).isspace())
+
+def get_printables(exclude_chars=u''):
+    # A negated character class instead of a Word over all ~65k printable
+    # characters, which kept tens of megabytes resident per process.
+    return Regex(u'[^\\s{}]+'.format(re.escape(exclude_chars)), re.UNICODE)
 
 
 def get_word():
-    return Word(unicode_printables, excludeChars=[')'])
+    return get_printables(u')')
 
 
 def get_value():
-    word = Word(unicode_printables, excludeChars=[')'])
+    word = get_printables(u')')
     quoted_word = QuotedString('"', unquoteResults=False, escChar='\\')
     return quoted_word | word
 
 
 def get_key():
-    return Word(unicode_printables,
-                excludeChars=[':', ':>', ':>=', ':<', ':<=', '('])
+    return get_printables(u':(')
 
 
 def get_operator():
@@ -40,15 +48,20 @@ def get_logical_operator():
     return CaselessLiteral('AND') | CaselessLiteral('OR') | White().suppress()
 
 
+def get_directive_start():
+    return Regex(u'(?:(?:size|from):\\s*[0-9]+(?!\\S)|fields:\\s*\\[)', re.UNICODE)
+
+
 def get_logical_expression():
     logical_operator = get_logical_operator()
-    compare_expression = get_key() + get_operator() + get_value()
+    # a directive is not a field compare, even right after another compare
+    compare_expression = ~get_directive_start() + get_key() + get_operator() + get_value()
     compare_expression.setParseAction(parse_compare_expression)
     base_logical_expression = (compare_expression
                                + logical_operator
                                + compare_expression).setParseAction(
-        parse_logical_expression) | compare_expression | Word(
-        unicode_printables).setParseAction(parse_free_text)
+        parse_logical_expression) | compare_expression | \
+        get_printables().setParseAction(parse_free_text)
     logical_expression = ('(' + base_logical_expression + ')').setParseAction(
         parse_paren_base_logical_expression) | base_logical_expression
     return logical_expression
@@ -74,10 +87,24 @@ def get_nested_logical_expression():
     return facet_logical_expression
 
 
+def get_facet_terms_expression():
+    # the size, and optionally the order, of a single facet
+    # e.g. skills:50 or skills:50(order:count). An unknown order is a
+    # parse error rather than a facet filter on a field called order.
+    order = (Keyword('count') | Keyword('term') | Keyword('reverse_count')
+             | Keyword('reverse_term'))
+    facet_terms_expression = Suppress(':') + Word(nums) + Optional(
+        Suppress('(') + Suppress('order') + Suppress(':')
+        - (order + Suppress(')')))
+    facet_terms_expression.setParseAction(parse_facet_terms_expression)
+    return facet_terms_expression
+
+
 def get_facet_expression():
     facet_logical_expression = get_nested_logical_expression()
     single_facet_expression = Word(
         srange("[a-zA-Z0-9_.]")) +\
+        Optional(get_facet_terms_expression()) +\
         Optional(
             Word('(').suppress() +
             OneOrMore(facet_logical_expression).setParseAction(
@@ -113,12 +140,29 @@ def get_nested_expression():
     return nested_expression
 
 
+def get_directive_expression():
+    # fields:[name, title] limits the returned _source fields,
+    # size:20 and from:40 select a page of results.
+    fields_expression = Suppress(Keyword('fields'))\
+        + Suppress(':')\
+        + Suppress('[')\
+        + OneOrMore(Word(srange("[a-zA-Z0-9_.*]")) + Optional(',').suppress())\
+        + Suppress(']')
+    fields_expression.setParseAction(parse_fields_expression)
+    page_expression = (Keyword('size') | Keyword('from'))\
+        + Suppress(':')\
+        + Regex(u'[0-9]+(?!\\S)', re.UNICODE)
+    page_expression.setParseAction(parse_page_expression)
+    return fields_expression | page_expression
+
+
 def _construct_grammar():
     logical_operator = get_logical_operator()
     logical_expression = get_logical_expression()
 
     facets_expression = get_facet_expression()
     nested_expression = get_nested_expression()
+    directive_expression = get_directive_expression()
 
     # The below line describes how the type expression should be.
     type_expression = Word('type')\
@@ -130,6 +174,7 @@ def _construct_grammar():
     base_expression = Optional(type_expression)\
         + ZeroOrMore((facets_expression
                       | nested_expression
+                      | directive_expression
                       | logical_expression)
                      + Optional(logical_operator)).setParseAction(
             parse_one_or_more_logical_expressions)
@@ -145,7 +190,105 @@ def _sanitize_query(query_string):
 
 grammar = LazyProxy(_construct_grammar)
 
-
-def tokenize(query_string):
-    return grammar.parseString(_sanitize_query(query_string),
-                               parseAll=True).asList()[0]
+WARMUP_QUERIES = (
+    u'type:warmup (abc:>def OR name:"foo bar") and ghi free text',
+    u'name:(krace OR kumar) facets:[aaa.bb(abc:def) bbb a:5(order:count)]',
+    u'nested:[aaa(a:(bb) abc:(def fff))] fields:[name, title] size:20 from:40',
+)
+
+
+# Plain free text queries are words separated by spaces which contain none
+# of the characters that start a compare, type, facets, nested or paren
+# expression.
+NON_FREE_TEXT_CHARS = re.compile(u'[:()\\[\\]]|[^\\S ]', re.UNICODE)
+
+LOGICAL_OPERATORS = ('and', 'or')
+
+counters = Counter()
+
+
+def _tokenize_free_text(query_string):
+    """
+    returns the query dsl of a plain free text query without running
+    the grammar, or None when the query needs the grammar.
+    """
+    if NON_FREE_TEXT_CHARS.search(query_string):
+        return None
+    words = []
+    expects_operator = False
+    for word in query_string.split(u' '):
+        if not word:
+            continue
+        lower_word = word.lower()
+        if expects_operator and lower_word in LOGICAL_OPERATORS:
+            words.append(word.upper())
+            expects_operator = False
+            continue
+        if expects_operator and lower_word.startswith(LOGICAL_OPERATORS):
+            # the grammar reads a leading "and"/"or" as an operator.
+            return None
+        words.append(sanitize_free_text(word))
+        expects_operator = True
+    return build_query_dsl([], u' '.join(words))
+
+
+def tokenize(query_string, **options):
+    """
+    returns the query dsl of a query string.
+    options are grammar_parsers.PARSE_OPTIONS such as field_mapping and
+    only apply to this call.
+    """
+    unknown_options = set(options) - set(PARSE_OPTIONS)
+    if unknown_options:
+        raise TypeError(u'unknown parse options: {}'.format(
+            u', '.join(sorted(unknown_options))))
+    previous_options = getattr(parse_context, 'options', None)
+    parse_context.options = dict(PARSE_OPTIONS, **options)
+    try:
+        return _tokenize(query_string)
+    finally:
+        parse_context.options = previous_options
+
+
+def _tokenize(query_string):
+    query_string = _sanitize_query(query_string)
+    query_dsl = _tokenize_free_text(query_string)
+    if query_dsl is not None:
+        counters['fast_path'] += 1
+        return query_dsl
+    counters['grammar'] += 1
+    return grammar.parseString(query_string, parseAll=True).asList()[0]
+
+
+def warmup(query_strings=WARMUP_QUERIES):
+    """
+    builds the grammar and runs every parse action once so that the
+    first real query does not pay for it. Call it in the master process
+    before forking workers so they share the built grammar.
+    The queries run straight through the grammar, so they are not
+    counted in counters.
+    """
+    for query_string in query_strings:
+        grammar.parseString(_sanitize_query(query_string), parseAll=True)
+    return grammar.__subject__
+
+
+def _get_rss():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * mmap.PAGESIZE
+
+
+def get_grammar_rss():
+    """
+    returns the resident memory in bytes taken by building a fresh
+    copy of the grammar, i.e. what the grammar costs every worker.
+    Only available where /proc/self/statm exists.
+    """
+    re.purge()
+    gc.collect()
+    rss = _get_rss()
+    built_grammar = _construct_grammar()
+    gc.collect()
+    rss = _get_rss() - rss
+    del built_grammar
+    return rss
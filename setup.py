@@ -1,13 +1,23 @@
 # -*- coding: utf-8 -*-
 
+import os
+import re
 from distutils.core import setup
 
+
+def get_version():
+    # read rather than imported, so setup.py does not need the dependencies
+    path = os.path.join(os.path.dirname(__file__), 'plasticparser', '__init__.py')
+    with open(path) as init_file:
+        return re.search(r"^__version__ = '([^']+)'", init_file.read(), re.M).group(1)
+
+
 long_description = """
  Let's to convert Google Like Query Language into ElasticSearch understandable Query DSL
  """
 
 setup(name='plasticparser',
-      version='0.2.9.3',
+      version=get_version(),
       description='An Elastic Search Query Parser',
       long_description=long_description,
       url='https://github.com/Aplopio/plasticparser',
@@ -2,3 +2,9 @@
 
 from test_plasticparser import *
 from test_tokenizer import *
+from test_canonicalizer import *
+from test_cache import *
+from test_field_mapping import *
+from test_frozen import *
+from test_replay import *
+from test_lexer import *
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from plasticparser import plasticparser
+from plasticparser.cache import SqliteQueryCache
+
+
+class SqliteQueryCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'queries.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_should_return_cached_query_dsl(self):
+        cache = SqliteQueryCache(self.path)
+        query_string = 'type:help (title:hello) facets:[aaa.bb(abc:def)]'
+        expected_query_dsl = plasticparser.get_query_dsl(query_string)
+        self.assertEqual(
+            plasticparser.get_query_dsl(query_string, cache=cache),
+            expected_query_dsl)
+        key = cache.get_key(query_string, facets_query_size=20, max_facets_query_size=None,
+                            max_result_window=10000,
+                            default_operator='and', merge_nested=False,
+                            field_mapping=None)
+        self.assertEqual(cache.get(key), expected_query_dsl)
+        self.assertEqual(
+            plasticparser.get_query_dsl(query_string, cache=cache),
+            expected_query_dsl)
+
+    def test_should_not_store_global_filters(self):
+        cache = SqliteQueryCache(self.path)
+        global_filters = {'and': [{"client_id": 1}], 'sort': [{"created_on": "desc"}]}
+        plasticparser.get_query_dsl('title:hello', global_filters, cache=cache)
+        query_dsl = plasticparser.get_query_dsl('title:hello', cache=cache)
+        self.assertEqual(query_dsl['query']['filtered']['filter']['bool']['must'], [])
+        self.assertNotIn('sort', query_dsl)
+
+    def test_should_key_on_options(self):
+        cache = SqliteQueryCache(self.path)
+        self.assertNotEqual(
+            cache.get_key('title:hello', default_operator='and'),
+            cache.get_key('title:hello', default_operator='or'))
+
+    def test_should_be_shared_and_expire_on_version_change(self):
+        cache = SqliteQueryCache(self.path, version='1')
+        key = cache.get_key('title:hello')
+        cache.set(key, {'query': {}})
+        self.assertEqual(SqliteQueryCache(self.path, version='1').get(key), {'query': {}})
+        self.assertEqual(SqliteQueryCache(self.path, version='2').get(key), None)
+        self.assertEqual(SqliteQueryCache(self.path, version='1').get(key), None)
+
+    def test_should_keep_entries_of_newer_versions(self):
+        new_cache = SqliteQueryCache(self.path, version='0.2.10')
+        key = new_cache.get_key('title:hello')
+        new_cache.set(key, {'query': {}})
+        old_cache = SqliteQueryCache(self.path, version='0.2.9')
+        old_cache.set(key + 'old', {'query': {}})
+        self.assertEqual(SqliteQueryCache(self.path, version='0.2.10').get(key),
+                         {'query': {}})
+
+    def test_should_bound_size_and_age(self):
+        cache = SqliteQueryCache(self.path, max_size=2, purge_interval=1)
+        for query_string in ['a:1', 'b:1', 'c:1']:
+            cache.set(cache.get_key(query_string), {'query': {}})
+        self.assertEqual(cache.get(cache.get_key('a:1')), None)
+        self.assertEqual(cache.get(cache.get_key('c:1')), {'query': {}})
+        cache._get_connection().execute('UPDATE queries SET created = 0')
+        cache._get_connection().commit()
+        self.assertEqual(SqliteQueryCache(self.path).get(cache.get_key('c:1')), None)
+
+    def test_should_be_shared_between_threads(self):
+        cache = SqliteQueryCache(self.path)
+        results = []
+
+        def set_and_get():
+            cache.set('thread', {'query': {'thread': True}})
+            results.append(cache.get('main'))
+
+        cache.set('main', {'query': {}})
+        thread = threading.Thread(target=set_and_get)
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [{'query': {}}])
+        self.assertEqual(cache.get('thread'), {'query': {'thread': True}})
+
+    def test_should_ignore_sqlite_errors(self):
+        cache = SqliteQueryCache(os.path.join(self.directory, 'missing', 'queries.db'))
+        cache.set('key', {'query': {}})
+        self.assertEqual(cache.get('key'), None)
+        cache.clear()
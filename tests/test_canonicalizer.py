@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from plasticparser import canonicalizer, plasticparser
+
+
+class CanonicalizerTest(unittest.TestCase):
+    def test_should_normalize_operator_case_whitespace_and_order(self):
+        self.assertEqual(
+            canonicalizer.canonicalize("type:def  mms:>asd and abc:>def"),
+            u'type:def abc:>def AND mms:>asd')
+        self.assertEqual(
+            canonicalizer.canonicalize("type:def abc:>def AND mms:>asd abc:>def"),
+            u'type:def abc:>def AND mms:>asd')
+
+    def test_should_keep_order_of_or_clauses(self):
+        self.assertEqual(
+            canonicalizer.canonicalize("python or java"), u'python OR java')
+        self.assertEqual(
+            canonicalizer.canonicalize("python java", default_operator='or'),
+            u'python java')
+
+    def test_should_not_split_parenthesised_or_quoted_clauses(self):
+        self.assertEqual(
+            canonicalizer.canonicalize('name:(krace OR kumar) "john doe"'),
+            u'"john doe" AND name:(krace OR kumar)')
+
+    def test_should_sort_facets_and_nested_clauses(self):
+        self.assertEqual(
+            canonicalizer.canonicalize(
+                "nested:[bbb(b:(c)) aaa(a:(b))] facets:[bbb(cc:ddd) aaa.bb]"),
+            u'nested:[aaa(a:(b)) bbb(b:(c))] facets:[aaa.bb:20 bbb:20(cc:ddd)]')
+        self.assertEqual(
+            canonicalizer.canonicalize("facets:[bbb:5(order:count), aaa.bb]"),
+            u'facets:[aaa.bb:20 bbb:5(order:count)]')
+
+    def test_should_normalize_directives(self):
+        self.assertEqual(
+            canonicalizer.canonicalize("size:20 python fields:[title, name,title] from:40"),
+            u'python fields:[name title] from:40 size:20')
+
+    def test_should_return_a_query_string_canonicalizing_to_itself(self):
+        for query_string, canonical_query in [
+                ('tags:dev:ops', u'tags:dev:ops'),
+                ('tags:dev\\:ops', u'tags:dev\\:ops'),
+                ('c++ AND java', u'c++ AND java'),
+                ('nested:[aaa(d:e-f)] facets:[bbb:20(cc:d-d)]',
+                 u'nested:[aaa(d:e-f)] facets:[bbb:20(cc:d-d)]')]:
+            self.assertEqual(canonicalizer.canonicalize(query_string), canonical_query)
+            self.assertEqual(canonicalizer.canonicalize(canonical_query), canonical_query)
+            self.assertEqual(plasticparser.get_query_dsl(canonical_query),
+                             plasticparser.get_query_dsl(query_string))
+        self.assertEqual(canonicalizer.canonicalize('java c++'), u'c++ AND java')
+
+    def test_should_return_same_hash_for_equivalent_queries(self):
+        self.assertEqual(
+            canonicalizer.get_query_hash("type:def (abc:>def) and mms:>asd"),
+            canonicalizer.get_query_hash("type:def   mms:>asd (abc:>def)"))
+        self.assertNotEqual(
+            canonicalizer.get_query_hash("type:def mms:>asd"),
+            canonicalizer.get_query_hash("type:abc mms:>asd"))
+
+    def test_should_hash_with_given_options_only(self):
+        query_hash = canonicalizer.get_query_hash('facets:[a]')
+        plasticparser.get_query_dsl('x', facets_query_size=50)
+        self.assertEqual(canonicalizer.get_query_hash('facets:[a]'), query_hash)
+        self.assertEqual(
+            canonicalizer.canonicalize('facets:[a]', facets_query_size=50),
+            u'facets:[a:50]')
+
+    def test_should_hash_default_operator(self):
+        self.assertNotEqual(
+            canonicalizer.get_query_hash('a b OR c', default_operator='and'),
+            canonicalizer.get_query_hash('a b OR c', default_operator='or'))
+        self.assertEqual(
+            canonicalizer.get_query_hash('a b OR c', default_operator='OR'),
+            canonicalizer.get_query_hash('a b OR c', default_operator='or'))
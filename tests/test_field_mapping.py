@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+
+from plasticparser import plasticparser, canonicalizer
+from plasticparser.field_mapping import FieldMapping, DisallowedFieldError
+
+
+class FieldMappingTest(unittest.TestCase):
+    def setUp(self):
+        self.field_mapping = FieldMapping(
+            aliases={'name': 'full_name', 'skill': 'skills.name', 'docs': 'documents'},
+            suffixes={'full_name': '_nonngram', 'title': '_nonngram'},
+            disallowed_fields=['salary'])
+
+    def test_should_map_fields(self):
+        self.assertEqual(self.field_mapping.get_field('name'), 'full_name_nonngram')
+        self.assertEqual(self.field_mapping.get_field('title'), 'title_nonngram')
+        self.assertEqual(self.field_mapping.get_field('skill'), 'skills.name')
+        self.assertEqual(self.field_mapping.get_field('city'), 'city')
+        self.assertEqual(self.field_mapping.get_index_field('name'), 'full_name')
+
+    def test_should_map_fields_while_parsing(self):
+        query_string = 'name:john title:dev facets:[skill(level:x)] nested:[docs(type:(pdf))]'
+        query_dsl = plasticparser.get_query_dsl(
+            query_string, field_mapping=self.field_mapping)
+        self.assertEqual(
+            query_dsl['query']['filtered']['query']['query_string']['query'],
+            u'full_name_nonngram:john title_nonngram:dev')
+        self.assertEqual(query_dsl['facets']['skill']['terms']['field'], 'name_nonngram')
+        self.assertEqual(query_dsl['facets']['skill']['nested'], 'skills')
+        self.assertEqual(
+            query_dsl['query']['filtered']['filter']['bool']['must'][0]['nested']['path'],
+            'documents')
+
+    def test_should_reject_disallowed_fields(self):
+        self.assertRaises(
+            DisallowedFieldError, plasticparser.get_query_dsl,
+            'title:dev salary:>100', field_mapping=self.field_mapping)
+        self.assertRaises(
+            DisallowedFieldError, plasticparser.get_query_dsl,
+            'facets:[salary]', field_mapping=self.field_mapping)
+        for query_string in ['facets:[aaa(salary:1)]', 'nested:[aaa(salary:(1))]',
+                             'facets:[aaa(title:dev OR (salary:1))]',
+                             'nested:[aaa(b:c +salary:1)]', '+salary:1']:
+            self.assertRaises(
+                DisallowedFieldError, plasticparser.get_query_dsl,
+                query_string, field_mapping=self.field_mapping)
+        plasticparser.get_query_dsl(
+            'facets:[aaa("salary:1" salary)]', field_mapping=self.field_mapping)
+
+    def test_should_apply_field_mapping_to_its_own_parse_only(self):
+        plasticparser.get_query_dsl('x', field_mapping=self.field_mapping)
+        self.assertEqual(canonicalizer.canonicalize('name:john'), u'name:john')
+        self.assertEqual(
+            plasticparser.get_document_types('type:a salary:1'), ['a'])
+
+    def test_should_not_share_field_mapping_between_threads(self):
+        failures = []
+
+        def parse(field_mapping):
+            for _ in range(50):
+                try:
+                    plasticparser.get_query_dsl(
+                        'salary:1', field_mapping=field_mapping)
+                    if field_mapping is not None:
+                        failures.append('allowed salary')
+                except DisallowedFieldError:
+                    if field_mapping is None:
+                        failures.append('rejected salary')
+
+        threads = [threading.Thread(target=parse, args=(field_mapping,))
+                   for field_mapping in (self.field_mapping, None) * 2]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(failures, [])
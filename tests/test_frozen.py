@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import copy
+import json
+import pickle
+import threading
+import unittest
+
+from plasticparser import plasticparser
+from plasticparser.cache import MemoryQueryCache
+from plasticparser.frozen import freeze, thaw, append_in, set_in
+
+
+class FrozenTest(unittest.TestCase):
+    def setUp(self):
+        self.query_dsl = {'query': {'bool': {'must': [{'term': {'a': 1}}]}},
+                          'facets': {'aaa': {'terms': {'field': 'aaa_nonngram'}}}}
+
+    def test_should_freeze_and_thaw_query_dsl(self):
+        frozen_dsl = freeze(self.query_dsl)
+        self.assertEqual(frozen_dsl, self.query_dsl)
+        self.assertEqual(json.loads(json.dumps(frozen_dsl)), self.query_dsl)
+        self.assertEqual(pickle.loads(pickle.dumps(frozen_dsl)), self.query_dsl)
+        self.assertEqual(copy.deepcopy(frozen_dsl), self.query_dsl)
+        self.assertRaises(TypeError, frozen_dsl.__setitem__, 'sort', [])
+        self.assertRaises(TypeError, frozen_dsl['query']['bool']['must'].append, {})
+        thawed_dsl = thaw(frozen_dsl)
+        thawed_dsl['query']['bool']['must'].append({})
+        self.assertEqual(len(frozen_dsl['query']['bool']['must']), 1)
+
+    def test_should_copy_only_changed_path(self):
+        frozen_dsl = freeze(self.query_dsl)
+        changed_dsl = append_in(frozen_dsl, ('query', 'bool', 'must'), [{'term': {'b': 2}}])
+        changed_dsl = set_in(changed_dsl, ('sort',), [{'created_on': 'desc'}])
+        self.assertEqual(changed_dsl['query']['bool']['must'],
+                         [{'term': {'a': 1}}, {'term': {'b': 2}}])
+        self.assertEqual(changed_dsl['sort'], [{'created_on': 'desc'}])
+        self.assertEqual(frozen_dsl, self.query_dsl)
+        self.assertTrue(changed_dsl['facets'] is frozen_dsl['facets'])
+        self.assertTrue(changed_dsl['query']['bool']['must'][0] is
+                        frozen_dsl['query']['bool']['must'][0])
+
+    def test_should_share_cached_query_dsl(self):
+        cache = MemoryQueryCache()
+        query_string = 'type:help (title:hello) facets:[aaa.bb(abc:def)]'
+        global_filters = {'and': [{"client_id": 1}], 'sort': [{"created_on": "desc"}]}
+        expected_query_dsl = plasticparser.get_query_dsl(query_string, global_filters)
+        first_query_dsl = plasticparser.get_query_dsl(
+            query_string, global_filters, cache=cache, frozen=True)
+        second_query_dsl = plasticparser.get_query_dsl(
+            query_string, global_filters, cache=cache, frozen=True)
+        self.assertEqual(first_query_dsl, expected_query_dsl)
+        self.assertEqual(second_query_dsl, expected_query_dsl)
+        self.assertTrue(first_query_dsl['facets'] is second_query_dsl['facets'])
+        self.assertEqual(
+            plasticparser.get_query_dsl(query_string, global_filters, cache=cache),
+            expected_query_dsl)
+
+    def test_should_share_memory_cache_between_threads(self):
+        cache = MemoryQueryCache(max_size=10)
+        errors = []
+
+        def use_cache():
+            try:
+                for index in range(2000):
+                    key = index % 20
+                    if cache.get(key) is None:
+                        cache.set(key, {'query': {'id': key}})
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=use_cache) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(cache._queries), 10)
+        for key in list(cache._queries):
+            self.assertEqual(cache.get(key), {'query': {'id': key}})
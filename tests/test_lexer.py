@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from plasticparser import lexer
+from plasticparser.lexer import Token
+
+
+class LexerTest(unittest.TestCase):
+    def test_should_yield_typed_tokens_with_positions(self):
+        query_string = 'type:def (abc:>def OR name:"foo bar") python'
+        self.assertEqual(list(lexer.iter_tokens(query_string)), [
+            Token(lexer.DIRECTIVE, 'type:', 0, 5),
+            Token(lexer.VALUE, 'def', 5, 8),
+            Token(lexer.PAREN, '(', 9, 10),
+            Token(lexer.KEY, 'abc', 10, 13),
+            Token(lexer.OPERATOR, ':>', 13, 15),
+            Token(lexer.VALUE, 'def', 15, 18),
+            Token(lexer.LOGICAL_OPERATOR, 'OR', 19, 21),
+            Token(lexer.KEY, 'name', 22, 26),
+            Token(lexer.OPERATOR, ':', 26, 27),
+            Token(lexer.VALUE, '"foo bar"', 27, 36),
+            Token(lexer.PAREN, ')', 36, 37),
+            Token(lexer.TEXT, 'python', 38, 44),
+        ])
+
+    def test_should_tokenize_directives_lists(self):
+        query_string = 'name:(krace or kumar) facets:[location:5, aaa(abc:def)] size:20'
+        self.assertEqual(
+            [(token.type, token.value) for token in lexer.iter_tokens(query_string)], [
+                (lexer.KEY, 'name'), (lexer.OPERATOR, ':'), (lexer.PAREN, '('),
+                (lexer.VALUE, 'krace'), (lexer.LOGICAL_OPERATOR, 'or'),
+                (lexer.VALUE, 'kumar'), (lexer.PAREN, ')'),
+                (lexer.DIRECTIVE, 'facets:'), (lexer.PAREN, '['),
+                (lexer.KEY, 'location'), (lexer.OPERATOR, ':'), (lexer.VALUE, '5'),
+                (lexer.SEPARATOR, ','), (lexer.KEY, 'aaa'), (lexer.PAREN, '('),
+                (lexer.KEY, 'abc'), (lexer.OPERATOR, ':'), (lexer.VALUE, 'def'),
+                (lexer.PAREN, ')'), (lexer.PAREN, ']'),
+                (lexer.DIRECTIVE, 'size:'), (lexer.VALUE, '20'),
+            ])
+
+    def test_should_only_tokenize_leading_type_as_directive(self):
+        self.assertEqual(list(lexer.iter_tokens('  type:def python')), [
+            Token(lexer.DIRECTIVE, 'type:', 2, 7),
+            Token(lexer.VALUE, 'def', 7, 10),
+            Token(lexer.TEXT, 'python', 11, 17),
+        ])
+        self.assertEqual(
+            [(token.type, token.value) for token in lexer.iter_tokens('python type:def')], [
+                (lexer.TEXT, 'python'), (lexer.KEY, 'type'),
+                (lexer.OPERATOR, ':'), (lexer.VALUE, 'def'),
+            ])
+        self.assertEqual(
+            [(token.type, token.value) for token in lexer.iter_tokens('facets:[a(type:x)]')], [
+                (lexer.DIRECTIVE, 'facets:'), (lexer.PAREN, '['), (lexer.KEY, 'a'),
+                (lexer.PAREN, '('), (lexer.KEY, 'type'), (lexer.OPERATOR, ':'),
+                (lexer.VALUE, 'x'), (lexer.PAREN, ')'), (lexer.PAREN, ']'),
+            ])
+
+    def test_should_report_error_position(self):
+        self.assertEqual(lexer.get_error_position('abc:def (x:y'), 8)
+        self.assertEqual(lexer.get_error_position('abc:def x:y)'), 11)
+        self.assertEqual(lexer.get_error_position('facets:[abc) def'), 11)
+        self.assertEqual(lexer.get_error_position('title:"open quote'), 6)
+        self.assertEqual(lexer.get_error_position('title:"closed quote" (a OR b)'), None)
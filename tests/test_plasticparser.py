@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 
 import unittest
+from pyparsing import ParseBaseException
 from plasticparser import plasticparser
+from plasticparser.grammar_parsers import DeepPagingError
 
 
 class PlasticParserTestCase(unittest.TestCase):
@@ -277,6 +279,69 @@ class PlasticParserTestCase(unittest.TestCase):
         self.assertEqual(elastic_query_dsl, expected_query_dsl)
 
 
+    def test_should_merge_nested_queries_sharing_a_path(self):
+        query_string = 'nested:[metadata_facets(field_value:(no)) skills(name:(python))] ' \
+                       'nested:[metadata_facets(field_name:(first))]'
+        expected_must_list = [
+            {
+                "nested": {
+                    "path": "metadata_facets",
+                    "query": {
+                        "query_string": {
+                            "query": "(field_value:(no)) AND (field_name:(first))",
+                            "default_operator": "and"
+                        }
+                    }
+                }
+            },
+            {
+                "nested": {
+                    "path": "skills",
+                    "query": {
+                        "query_string": {
+                            "query": "name:(python)",
+                            "default_operator": "and"
+                        }
+                    }
+                }
+            }
+        ]
+        elastic_query_dsl = plasticparser.get_query_dsl(query_string, merge_nested=True)
+        self.assertEqual(
+            elastic_query_dsl['query']['filtered']['filter']['bool']['must'],
+            expected_must_list)
+
+        elastic_query_dsl = plasticparser.get_query_dsl(query_string)
+        self.assertEqual(
+            len(elastic_query_dsl['query']['filtered']['filter']['bool']['must']), 3)
+
+    def test_should_cap_facet_sizes(self):
+        query_string = 'facets:[location:5, skills:500(order:count) city]'
+        elastic_query_dsl = plasticparser.get_query_dsl(
+            query_string, facets_query_size=150, max_facets_query_size=100)
+        self.assertEqual(elastic_query_dsl['facets'], {
+            'location': {'terms': {'field': 'location_nonngram', 'size': 5}},
+            'skills': {'terms': {'field': 'skills_nonngram', 'size': 100, 'order': 'count'}},
+            'city': {'terms': {'field': 'city_nonngram', 'size': 100}}})
+
+    def test_should_reject_unknown_facet_order(self):
+        for query_string in ['facets:[skills:50(order:terms)]',
+                             'facets:[skills:50(order:count x)]']:
+            self.assertRaises(ParseBaseException, plasticparser.get_query_dsl,
+                              query_string)
+
+    def test_should_limit_deep_paging(self):
+        query_string = 'python size:50 from:9960'
+        self.assertRaises(DeepPagingError, plasticparser.get_query_dsl, query_string)
+        elastic_query_dsl = plasticparser.get_query_dsl(query_string, max_result_window=20000)
+        self.assertEqual(elastic_query_dsl['from'], 9960)
+        self.assertRaises(DeepPagingError, plasticparser.get_query_dsl,
+                          'python from:95', max_result_window=100)
+
+    def test_should_apply_result_window_to_its_own_parse_only(self):
+        plasticparser.get_query_dsl('python', max_result_window=100)
+        self.assertTrue(plasticparser.is_facet_query('facets:[a] from:200'))
+
 
 class GetDocTypesTest(unittest.TestCase):
     def test_should_return_doc_types_of_query_string_if_any(self):
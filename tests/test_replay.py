@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import unittest
+from StringIO import StringIO
+
+from plasticparser import replay
+
+
+class ReplayTest(unittest.TestCase):
+    queries = ['type:help title:hello', 'python java', u'a:b\u2003c', 'name:(krace OR kumar)']
+
+    def test_should_replay_queries_on_threads_and_processes(self):
+        for mode in replay.MODES:
+            result = replay.replay(self.queries * 5, mode, workers=2)
+            self.assertEqual(result['queries'], 20)
+            self.assertEqual(result['errors'], 5)
+            self.assertTrue(result['throughput'] > 0)
+            self.assertTrue(result['p50'] <= result['p99'] <= result['max'])
+
+    def test_should_report_scaling(self):
+        results = [
+            {'mode': 'threads', 'workers': 1, 'throughput': 1000.0, 'mean': 1.0,
+             'p50': 1.0, 'p99': 2.0, 'max': 3.0, 'cpu': 1.0, 'errors': 0},
+            {'mode': 'threads', 'workers': 2, 'throughput': 1000.0, 'mean': 2.0,
+             'p50': 2.0, 'p99': 4.0, 'max': 6.0, 'cpu': 1.0, 'errors': 0},
+            {'mode': 'threads', 'workers': 4, 'throughput': 1000.0, 'mean': 4.0,
+             'p50': 4.0, 'p99': 8.0, 'max': 12.0, 'cpu': 1.0, 'errors': 0},
+            {'mode': 'processes', 'workers': 1, 'throughput': 1000.0, 'mean': 1.0,
+             'p50': 1.0, 'p99': 2.0, 'max': 3.0, 'cpu': 1.0, 'errors': 0},
+            {'mode': 'processes', 'workers': 2, 'throughput': 2000.0, 'mean': 1.0,
+             'p50': 1.0, 'p99': 2.0, 'max': 3.0, 'cpu': 2.0, 'errors': 0},
+        ]
+        stream = StringIO()
+        replay.report(results, stream)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[1].split()[-3:], ['100%', '0%', '0'])
+        self.assertEqual(lines[2].split()[-3:], ['50%', '50%', '0'])
+        self.assertEqual(lines[3].split()[-3:], ['25%', '-', '0'])
+        self.assertEqual(lines[5].split()[-3:], ['100%', '-', '0'])
+
+    def test_should_return_percentile(self):
+        self.assertEqual(replay.percentile([3, 1, 2, 4, 5], 50), 3)
+        self.assertEqual(replay.percentile([3, 1, 2, 4, 5], 99), 5)
+        self.assertEqual(replay.percentile([], 99), 0.0)
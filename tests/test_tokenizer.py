@@ -1,3 +1,5 @@
+import os
+import time
 import unittest
 
 from plasticparser import tokenizer, grammar_parsers
@@ -192,6 +194,28 @@ class TokenizerTest(unittest.TestCase):
                         'terms': {
                             'field': 'aaa_nonngram', 'size': 20}}}})
 
+    def test_should_parse_facets_with_size_and_order(self):
+        query_string = "facets: [location:5, skills:50(order:count), aaa.bb:10(order:term)(abc:def)]"
+        parsed_string = tokenizer.tokenize(query_string)
+        self.assertEqual(parsed_string['facets'], {
+            'location': {'terms': {'field': 'location_nonngram', 'size': 5}},
+            'skills': {'terms': {'field': 'skills_nonngram', 'size': 50, 'order': 'count'}},
+            'aaa.bb': {
+                'facet_filter': {
+                    'query': {
+                        'query_string': {
+                            'query': u'abc:def', "default_operator": "and"}}},
+                'terms': {'field': 'bb_nonngram', 'size': 10, 'order': 'term'},
+                'nested': u'aaa'}})
+
+    def test_should_parse_source_and_pagination_directives(self):
+        query_string = "type:def fields:[name, title] abc:>def size:20 from:40 size:>5"
+        parsed_string = tokenizer.tokenize(query_string)
+        self.assertEqual(parsed_string['_source'], {'includes': ['name', 'title']})
+        self.assertEqual(parsed_string['size'], 20)
+        self.assertEqual(parsed_string['from'], 40)
+        self.assertEqual(self.get_query_string(parsed_string), u'abc:>def size:>5')
+
     def test_should_parse_multiword_field_value(self):
         query_string = "name:(krace OR kumar) abc:>def"
         parsed_string = tokenizer.tokenize(query_string)
@@ -219,8 +243,82 @@ class TokenizerTest(unittest.TestCase):
                                                                                                          'default_operator': 'and'}}}}]}}}},
                                          })
 
+    def test_should_parse_multiple_nested_expressions(self):
+        query_string = "nested:[aaa(a:(bb)) ccc(c:(dd))] nested:[aaa(a:(bb))]"
+        parsed_string = tokenizer.tokenize(query_string)
+        must_list = parsed_string['query']['filtered']['filter']['bool']['must']
+        self.assertEqual(must_list, [
+            {'nested': {'path': 'aaa', 'query': {'query_string': {
+                'query': u'a:(bb)', 'default_operator': 'and'}}}},
+            {'nested': {'path': 'ccc', 'query': {'query_string': {
+                'query': u'c:(dd)', 'default_operator': 'and'}}}}])
+
     def test_should_escape_value_with_colon(self):
         query_string = "tags:dev:ops"
         parsed_string = tokenizer.tokenize(query_string)
         self.assertEqual(parsed_string['query']['filtered']['query']['query_string']['query'],
-                         u'tags:dev\:ops')
\ No newline at end of file
+                         u'tags:dev\:ops')
+
+    def test_should_build_grammar_on_warmup(self):
+        tokenizer.counters.clear()
+        built_grammar = tokenizer.warmup()
+        self.assertTrue(built_grammar is tokenizer.grammar.__subject__)
+        self.assertEqual(tokenizer.counters, {})
+
+    def test_should_parse_non_ascii_values(self):
+        query_string = u"caf\xe9 name:\u0928\u092e\u0938"
+        parsed_string = tokenizer.tokenize(query_string)
+        self.assertEqual(self.get_query_string(parsed_string), query_string)
+
+    @unittest.skipUnless(os.path.exists('/proc/self/statm'),
+                         'needs /proc/self/statm')
+    def test_should_keep_grammar_memory_small(self):
+        self.assertTrue(tokenizer.get_grammar_rss() < 10 * 1024 * 1024)
+
+    def test_should_parse_free_text_without_grammar(self):
+        for query_string in ['abc def', 'python and java or c++', 'and x',
+                             'a && b !c', 'abc android', 'q/a [x]', '']:
+            expected_query_dsl = tokenizer.grammar.parseString(
+                query_string, parseAll=True).asList()[0]
+            self.assertEqual(tokenizer.tokenize(query_string), expected_query_dsl)
+
+    def test_should_count_free_text_queries(self):
+        tokenizer.counters.clear()
+        tokenizer.tokenize('python java')
+        tokenizer.tokenize('python android')
+        tokenizer.tokenize('type:def python')
+        self.assertEqual(tokenizer.counters, {'fast_path': 1, 'grammar': 2})
+
+    def get_parse_time(self, query_string):
+        start = time.time()
+        tokenizer.tokenize(query_string)
+        return time.time() - start
+
+    def test_should_parse_large_free_text_in_linear_time(self):
+        ids = [u'{}-{}'.format(index, index) for index in range(100000)]
+        small_time = self.get_parse_time(u' '.join(ids[:10000]))
+        large_time = self.get_parse_time(u' '.join(ids))
+        # quadratic growth would take about 100 times as long
+        self.assertTrue(large_time < 30 * max(small_time, 0.001))
+
+    def test_should_escape_every_word_of_large_free_text(self):
+        query_string = u' '.join(u'{}-{}'.format(index, index)
+                                 for index in range(100000))
+        parsed_string = tokenizer.tokenize(query_string)
+        self.assertEqual(self.get_query_string(parsed_string),
+                         query_string.replace(u'-', u'\\-'))
+
+    def test_should_parse_large_expressions_in_linear_time(self):
+        # compares go through the grammar and its parse actions, unlike
+        # free text. This takes several seconds.
+        compares = [u'id:{}-{}'.format(index, index) for index in range(100000)]
+        small_time = self.get_parse_time(u' '.join(compares[:10000]))
+        tokenizer.counters.clear()
+        query_string = u' '.join(compares)
+        start = time.time()
+        parsed_string = tokenizer.tokenize(query_string)
+        large_time = time.time() - start
+        self.assertEqual(tokenizer.counters, {'grammar': 1})
+        self.assertEqual(self.get_query_string(parsed_string),
+                         query_string.replace(u'-', u'\\-'))
+        self.assertTrue(large_time < 30 * max(small_time, 0.001))